@@ -1,4 +1,5 @@
 from .persor import BVHparser
+from .skeleton import clear_skeleton_cache, stack_motions
 
-__all__ = ["BVHparser"]
+__all__ = ["BVHparser", "clear_skeleton_cache", "stack_motions"]
 __version__ = "1.0.6"
@@ -0,0 +1,367 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from pathlib import Path
+import argparse
+import json
+import os
+import sys
+import time
+
+from mcp_persor.persor import BVHparser
+
+# 出力ファイルごとの変換オプションを記録するファイル
+MANIFEST_NAME = ".mcp-persor.json"
+
+# 変換オプションの記録を書き込む間隔 (完了したファイル数)
+MANIFEST_INTERVAL = 10
+
+
+def get_bvh_files(input_dir: Path, exclude_dir: Path | None = None):
+    """
+    ディレクトリ以下のBVHファイルを再帰的に取得する
+
+    Parameters
+    ----------
+    input_dir : Path
+        入力ディレクトリ
+    exclude_dir : Path
+        探索しないディレクトリ (入力ディレクトリ内の出力ディレクトリなど)
+
+    Returns
+    -------
+    list
+        BVHファイルのパス
+    """
+
+    exclude = exclude_dir.resolve() if exclude_dir is not None else None
+
+    files = []
+    for dirpath, dirnames, filenames in os.walk(input_dir):
+        dirnames[:] = [
+            d for d in dirnames if (Path(dirpath) / d).resolve() != exclude
+        ]
+        files += [
+            Path(dirpath) / f for f in filenames if Path(f).suffix.lower() == ".bvh"
+        ]
+
+    return sorted(files)
+
+
+def get_output_path(src: Path, input_dir: Path, output_dir: Path, suffix: str):
+    """
+    入力ファイルに対応する出力ファイルのパスを取得する
+
+    Parameters
+    ----------
+    src : Path
+        入力ファイル
+    input_dir : Path
+        入力ディレクトリ
+    output_dir : Path
+        出力ディレクトリ
+    suffix : str
+        出力ファイルの拡張子
+
+    Returns
+    -------
+    Path
+        出力ファイルのパス
+    """
+
+    return (output_dir / src.relative_to(input_dir)).with_suffix(suffix)
+
+
+def read_manifest(output_dir: Path):
+    """
+    出力ディレクトリの変換オプションの記録を読み込む
+
+    Parameters
+    ----------
+    output_dir : Path
+        出力ディレクトリ
+
+    Returns
+    -------
+    dict
+        出力ファイルの相対パスと変換オプションの対応
+    """
+
+    path = output_dir / MANIFEST_NAME
+    if not path.exists():
+        return {}
+
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(output_dir: Path, manifest: dict):
+    """
+    出力ディレクトリに変換オプションの記録を書き込む.
+    途中で中断されても壊れないよう, 一時ファイルに書き込んでから置き換える
+
+    Parameters
+    ----------
+    output_dir : Path
+        出力ディレクトリ
+    manifest : dict
+        出力ファイルの相対パスと変換オプションの対応
+    """
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / MANIFEST_NAME
+    tmp_path = output_dir / f"{MANIFEST_NAME}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def is_up_to_date(src: Path, dst: Path, options: dict, recorded: dict | None):
+    """
+    出力ファイルが入力ファイルより新しく, 同じ変換オプションで作られたかどうか
+
+    Parameters
+    ----------
+    src : Path
+        入力ファイル
+    dst : Path
+        出力ファイル
+    options : dict
+        今回の変換オプション
+    recorded : dict
+        出力ファイルを作成したときの変換オプション
+
+    Returns
+    -------
+    bool
+        出力ファイルが最新であれば True
+    """
+
+    return (
+        recorded == options
+        and dst.exists()
+        and dst.stat().st_mtime >= src.stat().st_mtime
+    )
+
+
+def process_file(
+    command: str,
+    src: str,
+    dst: str,
+    position: list[float] | None = None,
+    rotation: list[float] | None = None,
+):
+    """
+    1つのBVHファイルを変換する (ワーカープロセスで実行される)
+
+    Parameters
+    ----------
+    command : str
+        convert: CSVに変換する
+        normalize: 初期位置・初期回転量を設定してBVHに出力する
+    src : str
+        入力ファイル
+    dst : str
+        出力ファイル
+    position : list
+        初期位置
+    rotation : list
+        初期回転量
+
+    Returns
+    -------
+    int
+        処理したフレーム数
+    """
+
+    bvhp = BVHparser(src)
+    Path(dst).parent.mkdir(parents=True, exist_ok=True)
+
+    if command == "convert":
+        bvhp.to_csv(dst)
+    elif command == "normalize":
+        if position is not None:
+            bvhp.set_initial_position(position)
+        if rotation is not None:
+            bvhp.set_initial_rotation(rotation)
+        bvhp.to_bvh(dst)
+    else:
+        raise ValueError(f"invalid command: {command}")
+
+    return bvhp.motion_df.shape[0]
+
+
+def run(args: argparse.Namespace):
+    """
+    ディレクトリ以下のBVHファイルを並列に変換する
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        コマンドライン引数
+
+    Returns
+    -------
+    dict
+        処理結果のサマリー
+    """
+
+    input_dir = Path(args.input)
+    output_dir = Path(args.output)
+    suffix = ".csv" if args.command == "convert" else ".bvh"
+
+    if not input_dir.is_dir():
+        raise ValueError(f"input is not a directory: {input_dir}")
+    if args.command == "normalize" and input_dir.resolve() == output_dir.resolve():
+        raise ValueError("output must be different from input for normalize")
+
+    position = getattr(args, "position", None)
+    rotation = getattr(args, "rotation", None)
+    options = {"command": args.command, "position": position, "rotation": rotation}
+    manifest = read_manifest(output_dir)
+
+    tasks = []
+    skipped = []
+    exclude_dir = None if input_dir.resolve() == output_dir.resolve() else output_dir
+    for src in get_bvh_files(input_dir, exclude_dir):
+        dst = get_output_path(src, input_dir, output_dir, suffix)
+        key = dst.relative_to(output_dir).as_posix()
+        if not args.force and is_up_to_date(src, dst, options, manifest.get(key)):
+            skipped.append(str(src))
+        else:
+            tasks.append((src, dst))
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    converted = []
+    failed = []
+    frames = 0
+    start = time.perf_counter()
+
+    # 中断されても変換済みのファイルは次回スキップされるよう, 記録は逐次書き込む
+    pool = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        futures = {
+            pool.submit(
+                process_file, args.command, str(src), str(dst), position, rotation
+            ): (src, dst)
+            for (src, dst) in tasks
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            (src, dst) = futures[future]
+            key = dst.relative_to(output_dir).as_posix()
+            try:
+                frames += future.result()
+                converted.append(str(src))
+                manifest[key] = options
+                status = "ok"
+            except Exception as e:
+                failed.append({"file": str(src), "error": f"{type(e).__name__}: {e}"})
+                manifest.pop(key, None)
+                status = "failed"
+
+            if i % MANIFEST_INTERVAL == 0:
+                write_manifest(output_dir, manifest)
+
+            if not args.quiet:
+                elapsed = time.perf_counter() - start
+                print(
+                    f"[{i}/{len(tasks)}] {status} {src} "
+                    + f"({i / elapsed:.1f} files/s, {frames / elapsed:.0f} frames/s)",
+                    file=sys.stderr,
+                )
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if len(tasks) > 0:
+            write_manifest(output_dir, manifest)
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        "command": args.command,
+        "input": str(input_dir),
+        "output": str(output_dir),
+        "jobs": jobs,
+        "converted": len(converted),
+        "skipped": len(skipped),
+        "failed": len(failed),
+        "frames": frames,
+        "elapsed": elapsed,
+        "files_per_second": len(converted) / elapsed if elapsed > 0 else 0.0,
+        "frames_per_second": frames / elapsed if elapsed > 0 else 0.0,
+        "failures": failed,
+    }
+
+
+def get_parser():
+    """
+    コマンドライン引数のパーサーを取得する
+
+    Returns
+    -------
+    argparse.ArgumentParser
+        パーサー
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="mcp-persor", description="BVHファイルを一括で変換する"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert = subparsers.add_parser("convert", help="BVHファイルをCSVに変換する")
+    normalize = subparsers.add_parser(
+        "normalize", help="初期位置・初期回転量を設定してBVHに出力する"
+    )
+    normalize.add_argument(
+        "--position", type=float, nargs=3, metavar=("X", "Y", "Z"), help="初期位置"
+    )
+    normalize.add_argument(
+        "--rotation", type=float, nargs=3, metavar=("X", "Y", "Z"), help="初期回転量"
+    )
+
+    for sub in (convert, normalize):
+        sub.add_argument("input", help="入力ディレクトリ")
+        sub.add_argument("output", help="出力ディレクトリ")
+        sub.add_argument(
+            "-j", "--jobs", type=int, default=0, help="ワーカー数 (0: CPUコア数)"
+        )
+        sub.add_argument(
+            "-f", "--force", action="store_true", help="最新の出力ファイルも変換する"
+        )
+        sub.add_argument("--report", help="サマリーを出力するJSONファイル")
+        sub.add_argument(
+            "-q", "--quiet", action="store_true", help="進捗を表示しない"
+        )
+
+    return parser
+
+
+def main(argv: list[str] | None = None):
+    args = get_parser().parse_args(argv)
+
+    try:
+        # 書き込めないレポートのパスは変換を始める前にエラーにするため, 先に開いておく
+        with (
+            open(args.report, "w") if args.report is not None else nullcontext()
+        ) as report:
+            summary = run(args)
+
+            print(
+                f"converted: {summary['converted']}, skipped: {summary['skipped']}, "
+                + f"failed: {summary['failed']}, elapsed: {summary['elapsed']:.2f}s "
+                + f"({summary['files_per_second']:.1f} files/s)",
+                file=sys.stderr,
+            )
+
+            if report is not None:
+                json.dump(summary, report, indent=2, ensure_ascii=False)
+    except (ValueError, OSError) as e:
+        print(f"mcp-persor: {e}", file=sys.stderr)
+        return 2
+
+    return 1 if summary["failed"] > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
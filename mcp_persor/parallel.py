@@ -0,0 +1,169 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Sequence
+import os
+
+import numpy as np
+
+
+def get_chunks(n: int, n_jobs: int, chunk_size: int | None = None):
+    """
+    フレーム軸を分割したスライスのリストを取得する
+
+    Parameters
+    ----------
+    n : int
+        フレーム数
+    n_jobs : int
+        ワーカー数
+    chunk_size : int
+        1チャンクあたりのフレーム数. Noneの場合はワーカー数で等分する
+
+    Returns
+    -------
+    list
+        フレーム範囲のスライス
+    """
+
+    if chunk_size is None:
+        chunk_size = max(1, -(-n // n_jobs))
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive. but got {chunk_size}")
+
+    return [slice(i, min(i + chunk_size, n)) for i in range(0, n, chunk_size)]
+
+
+def _sum_path(arrays: Sequence[np.ndarray], out: np.ndarray, chunk: slice):
+    """
+    指定したフレーム範囲について, パス上の関節の値を順に足し合わせる
+
+    Parameters
+    ----------
+    arrays : list
+        (フレーム数, チャンネル数) の入力配列のリスト (または3次元配列)
+    out : numpy.ndarray
+        (フレーム数, チャンネル数) の出力配列
+    chunk : slice
+        処理するフレーム範囲
+    """
+
+    # 単一スレッドの場合と同じ順序で足し合わせ, 結果を一致させる
+    out[chunk] = arrays[0][chunk]
+    for i in range(1, len(arrays)):
+        out[chunk] += arrays[i][chunk]
+
+
+def _sum_path_shared(
+    in_name: str, out_name: str, shape: tuple, dtype: str, chunk: slice
+):
+    """
+    共有メモリ上の配列に対して _sum_path を実行する (プロセスプール用)
+    """
+
+    in_shm = shared_memory.SharedMemory(name=in_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    try:
+        stack = np.ndarray(shape, dtype=dtype, buffer=in_shm.buf)
+        out = np.ndarray(shape[1:], dtype=dtype, buffer=out_shm.buf)
+        _sum_path(stack, out, chunk)
+        del stack, out
+    finally:
+        in_shm.close()
+        out_shm.close()
+
+
+def _get_n_jobs(n_jobs: int):
+    if n_jobs == -1:
+        return os.cpu_count() or 1
+    if n_jobs < 1:
+        raise ValueError(f"n_jobs must be positive or -1. but got {n_jobs}")
+    return n_jobs
+
+
+def _sum_path_threads(
+    arrays: Sequence[np.ndarray], chunks: list[slice], pool: Executor
+):
+    out = np.empty(arrays[0].shape, dtype=float)
+    list(pool.map(lambda chunk: _sum_path(arrays, out, chunk), chunks))
+    return out
+
+
+def _sum_path_processes(
+    arrays: Sequence[np.ndarray], chunks: list[slice], pool: Executor
+):
+    shape = (len(arrays), *arrays[0].shape)
+    dtype = np.dtype(float)
+    nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+    in_shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    out_shm = shared_memory.SharedMemory(create=True, size=max(1, nbytes // shape[0]))
+    try:
+        # 入力は共有メモリ上に直接組み立てる
+        stack = np.ndarray(shape, dtype=dtype, buffer=in_shm.buf)
+        for i, array in enumerate(arrays):
+            stack[i] = array
+        futures = [
+            pool.submit(
+                _sum_path_shared, in_shm.name, out_shm.name, shape, dtype.str, chunk
+            )
+            for chunk in chunks
+        ]
+        for future in futures:
+            future.result()
+
+        # 共有メモリは解放するため, 結果をこのプロセスのメモリに1度だけコピーする
+        out = np.ndarray(shape[1:], dtype=dtype, buffer=out_shm.buf)
+        result = out.copy()
+        del stack, out
+        return result
+    finally:
+        in_shm.close()
+        in_shm.unlink()
+        out_shm.close()
+        out_shm.unlink()
+
+
+def sum_path_chunked(
+    arrays: Sequence[np.ndarray],
+    n_jobs: int = -1,
+    chunk_size: int | None = None,
+    executor: str | Executor = "thread",
+):
+    """
+    パス上の関節の値の和をフレーム軸で分割して並列に計算する
+
+    Parameters
+    ----------
+    arrays : list
+        同じ形状 (フレーム数, チャンネル数) の入力配列のリスト
+    n_jobs : int
+        ワーカー数. -1の場合はCPUコア数
+    chunk_size : int
+        1チャンクあたりのフレーム数
+    executor : str or concurrent.futures.Executor
+        thread: スレッドプールで処理する. 入力配列はコピーせずに共有する
+        process: 共有メモリを介してプロセスプールで処理する.
+            入力配列を共有メモリに1度書き込み, 結果を共有メモリから1度コピーする.
+            呼び出しごとにプロセスを起動するため, 非常に長いクリップでのみ有効
+        Executor: 渡されたプールを使う (ProcessPoolExecutor の場合は共有メモリを介する)
+
+    Returns
+    -------
+    numpy.ndarray
+        (フレーム数, チャンネル数) の計算結果
+    """
+
+    n_jobs = _get_n_jobs(n_jobs)
+    chunks = get_chunks(arrays[0].shape[0], n_jobs, chunk_size)
+
+    if isinstance(executor, ProcessPoolExecutor):
+        return _sum_path_processes(arrays, chunks, executor)
+    elif isinstance(executor, Executor):
+        return _sum_path_threads(arrays, chunks, executor)
+    elif executor == "thread":
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            return _sum_path_threads(arrays, chunks, pool)
+    elif executor == "process":
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            return _sum_path_processes(arrays, chunks, pool)
+    else:
+        raise ValueError(f"invalid executor: {executor}")
@@ -1,27 +1,124 @@
+from concurrent.futures import Executor
+from contextlib import nullcontext
+from typing import Iterable
+import math
+
 import pandas as pd
 import numpy as np
 import time
 
+from mcp_persor.parallel import sum_path_chunked
+from mcp_persor.skeleton import (
+    SharedSkeleton,
+    copy_joints,
+    get_channels,
+    intern_skeleton,
+)
 from mcp_persor.type import JointData
 
 
 class BVHparser:
-    def __init__(self, filename: str):
-        self.bvh = self.__readfile(filename)
+    def __init__(
+        self,
+        filename: str,
+        share_skeleton=True,
+        offset_tolerance: float = 1e-6,
+        joints: list[str] | None = None,
+        frames: slice | None = None,
+        time_range: tuple[float, float] | None = None,
+    ):
+        """
+        Parameters
+        ----------
+        filename : str
+            BVHファイルのパス
+        share_skeleton : bool
+            同じ構造の骨格を持つ他のクリップと骨格データを共有するかどうか
+        offset_tolerance : float
+            骨格を共有する際に offset を同一とみなす許容誤差
+        joints : list
+            読み込むjoint. 指定したjointとrootまでの祖先のチャンネルのみ読み込む.
+            End Site を指定した場合はその親のjointを読み込む. 骨格データは全て保持する
+        frames : slice
+            読み込むフレームの範囲
+        time_range : tuple
+            読み込む時間の範囲 (t0 <= time < t1). frames とは同時に指定できない
+
+        Notes
+        -----
+        joints, frames, time_range のいずれかを指定した場合はファイルを1行ずつ読み込み,
+        不要な行・カラムは数値に変換しない. この場合 self.bvh は None になる.
+
+        frames, time_range を指定した場合, データフレームのindexは読み込んだ先頭の
+        フレームを0として振り直される (time カラムは元のフレームの時刻のまま).
+        get_initial_position(index=100) などのindexは元のフレーム番号ではなく
+        読み込んだ行の番号を指すため, 範囲が短い場合は KeyError になる
+        """
 
-        lines = self.bvh.split("\n")
+        if frames is not None and time_range is not None:
+            raise ValueError("frames and time_range cannot be specified together")
 
-        hierarchy_tokens = self.__get_hierarchy_tokens(lines)
-        (skeleton, root) = self.__get_joint(hierarchy_tokens)
-        self.skeleton = skeleton
-        self.root = root
-        self.channels = self.__get_channels()
+        is_selective = joints is not None or frames is not None or time_range is not None
 
-        (frame_time, motion) = self.__get_motion(lines)
+        lines: Iterable[str]
+        if is_selective:
+            self.bvh = None
+            f = open(filename, "r")
+            lines = f
+        else:
+            self.bvh = self.__readfile(filename)
+            f = nullcontext()
+            lines = iter(self.bvh.split("\n"))
+
+        with f:
+            hierarchy_tokens = self.__get_hierarchy_tokens(lines)
+            (skeleton, root) = self.__get_joint(hierarchy_tokens)
+            self.root = root
+            self.shared_skeleton: SharedSkeleton | None = None
+            if share_skeleton:
+                self.shared_skeleton = intern_skeleton(
+                    skeleton, root, offset_tolerance
+                )
+                self.skeleton = self.shared_skeleton.joints
+                self.channels = self.shared_skeleton.channels
+            else:
+                self.skeleton = skeleton
+                self.channels = get_channels(self.skeleton)
+
+            if is_selective:
+                all_channels = self.channels
+                if joints is not None:
+                    self.channels = self.__get_selected_channels(joints)
+                column_indices = [all_channels.index(c) for c in self.channels]
+
+                (frame_time, frame_indices, motion) = self.__get_selected_motion(
+                    lines, column_indices, frames, time_range
+                )
+            else:
+                (frame_time, motion) = self.__get_motion(lines)
+                frame_indices = None
 
         self.frame_time = frame_time
-        self.default_motion_df = self.__convert_default_motion_df(motion)
-        self.motion_df = self.default_motion_df.copy()
+        self.default_motion_df = self.__convert_default_motion_df(
+            motion, frame_indices
+        )
+        self.motion_df = self.__share_columns(self.default_motion_df.copy())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # 共有している骨格データは shared_skeleton から復元する
+        if self.shared_skeleton is not None:
+            del state["skeleton"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        if self.shared_skeleton is not None:
+            self.skeleton = self.shared_skeleton.joints
+            if tuple(self.channels) == self.shared_skeleton.channels:
+                self.channels = self.shared_skeleton.channels
+            self.__share_columns(self.default_motion_df)
+            self.__share_columns(self.motion_df)
 
     def __readfile(self, filename: str):
         """
@@ -56,13 +153,14 @@ class BVHparser:
         except ValueError:
             return None
 
-    def __get_hierarchy_tokens(self, lines: list[str]):
+    def __get_hierarchy_tokens(self, lines: Iterable[str]):
         """
-        BVHファイルからHierarchy部をトークンごとの配列に変換する
+        BVHファイルからHierarchy部をトークンごとの配列に変換する.
+        lines はHierarchy部の終わりまで読み進められる
 
         Parameters
         ----------
-        lines : list
+        lines : iterator
             BVHファイルの行データ
 
         Returns
@@ -76,8 +174,7 @@ class BVHparser:
         nesting_level = 0
         is_closeing = False
 
-        for i in range(len(lines)):
-            line = lines.pop(0)
+        for line in lines:
             tokens += line.split()
             nesting_level += line.count("{") - line.count("}")
             index += 1
@@ -173,71 +270,194 @@ class BVHparser:
 
         return (skeleton, root)
 
-    def __get_channels(self):
+    def __get_motion(self, lines: Iterable[str]):
         """
-        チャンネル名のリストを取得する
+        行ごとの配列からモーションデータを取得する
+
+        Parameters
+        ----------
+        lines : iterator
+            Motion部の行データ
 
         Returns
         -------
         list
-            チャンネル名のリスト
+            モーションデータ
+        """
+
+        motion = []
+        frame_time = None
+        for line in lines:
+            if "MOTION" in line:
+                continue
+            elif "Frames:" in line:
+                continue
+            elif "Frame Time:" in line:
+                frame_time = self.__try_to_float(line.split()[2])
+            else:
+                motion += [self.__try_to_float(v) for v in line.split()]
+
+        n = len(self.channels)
+        new_motion = [motion[i : i + n] for i in range(0, len(motion), n)]
+
+        return (frame_time, new_motion)
+
+    def __get_selected_channels(self, joints: list[str]):
+        """
+        指定したjointとその祖先のチャンネル名のリストを取得する
+
+        Parameters
+        ----------
+        joints : list
+            読み込むjoint
+
+        Returns
+        -------
+        list
+            チャンネル名のリスト (ファイル内の順序)
         """
 
+        missing_joints = set(joints) - set(self.skeleton.keys())
+        if len(missing_joints) > 0:
+            raise ValueError(f"joints {missing_joints} are not in skeleton")
+
+        selected_joints = set()
+        for joint in joints:
+            # End Site は親が自身になっているため, 親のjointに置き換えてから辿る
+            if joint.startswith("_End_") and joint[len("_End_") :] in self.skeleton:
+                joint = joint[len("_End_") :]
+            selected_joints.update(self.get_skeleton_path2root(joint))
+
         channels = []
         for j in self.skeleton.keys():
-            channels += [f"{j}_{c}" for c in self.skeleton[j]["channels"]]
+            if j in selected_joints:
+                channels += [f"{j}_{c}" for c in self.skeleton[j]["channels"]]
 
         return channels
 
-    def __get_motion(self, lines: list[str]):
+    def __get_selected_motion(
+        self,
+        lines: Iterable[str],
+        column_indices: list[int],
+        frames: slice | None,
+        time_range: tuple[float, float] | None,
+    ):
         """
-        行ごとの配列からモーションデータを取得する
+        行ごとのイテレータから指定したフレーム・カラムのモーションデータを取得する.
+        範囲外の行は数値に変換せず, 最後のフレーム以降は読み込まない
 
         Parameters
         ----------
-        tokens : list
-            Motion部のトークン
+        lines : iterator
+            Motion部の行データ (1行1フレーム)
+        column_indices : list
+            読み込むカラムの番号
+        frames : slice
+            読み込むフレームの範囲
+        time_range : tuple
+            読み込む時間の範囲
 
         Returns
         -------
-        list
-            モーションデータ
+        tuple
+            フレーム時間, 読み込んだフレームの番号, モーションデータ
         """
 
-        motion = []
         frame_time = None
-        for i in range(len(lines)):
-            if "MOTION" in lines[i]:
+        frames_num = None
+        for line in lines:
+            if "MOTION" in line:
                 continue
-            elif "Frames:" in lines[i]:
+            elif "Frames:" in line:
+                frames_num = int(line.split()[1])
+            elif "Frame Time:" in line:
+                frame_time = self.__try_to_float(line.split()[2])
+                break
+
+        if frame_time is None or frames_num is None:
+            raise ValueError("Frames or Frame Time is missing in MOTION section")
+
+        if time_range is not None:
+            # t0 <= i * frame_time < t1 となるフレーム番号 i の範囲
+            (t0, t1) = time_range
+            eps = 1e-9
+            frames = slice(
+                max(0, math.ceil(t0 / frame_time - eps)),
+                max(0, math.ceil(t1 / frame_time - eps)),
+            )
+
+        if frames is None:
+            frames = slice(None)
+        (start, stop, step) = frames.indices(frames_num)
+        if step < 0:
+            raise ValueError(f"frames step must be positive. but got {step}")
+
+        frame_indices = []
+        motion = []
+        i = 0
+        for line in lines:
+            if i >= stop:
+                break
+            if line.strip() == "":
                 continue
-            elif "Frame Time:" in lines[i]:
-                frame_time = self.__try_to_float(lines[i].split()[2])
-            else:
-                motion += [self.__try_to_float(v) for v in lines[i].split()]
 
-        n = len(self.channels)
-        new_motion = [motion[i : i + n] for i in range(0, len(motion), n)]
+            if i >= start and (i - start) % step == 0:
+                values = line.split()
+                motion.append([self.__try_to_float(values[c]) for c in column_indices])
+                frame_indices.append(i)
+            i += 1
 
-        return (frame_time, new_motion)
+        return (frame_time, frame_indices, motion)
 
-    def __convert_default_motion_df(self, motion: list[list]):
+    def __convert_default_motion_df(
+        self, motion: list[list], frame_indices: list[int] | None = None
+    ):
         """
         モーションの二次元配列からデータフレームに変換する
 
+        Parameters
+        ----------
+        motion : list
+            モーションデータ
+        frame_indices : list
+            各行のフレーム番号. Noneの場合は先頭から連続したフレームとみなす
+
         Returns
         -------
         pandas.DataFrame
             モーションデータ
         """
 
-        motion_df = pd.DataFrame(motion)
-        motion_df.columns = self.channels
-        time = np.arange(0, motion_df.shape[0]) * self.frame_time
+        motion_df = pd.DataFrame(motion, columns=self.channels, dtype=float)
+        if frame_indices is None:
+            frame_indices = np.arange(0, motion_df.shape[0])
+        time = np.asarray(frame_indices) * self.frame_time
         motion_df.insert(0, "time", time)
         for column in motion_df.columns:
             motion_df[column] = pd.to_numeric(motion_df[column], errors="coerce")
 
+        return self.__share_columns(motion_df)
+
+    def __share_columns(self, motion_df: pd.DataFrame):
+        """
+        カラムが共有している骨格と同じであれば, 骨格のカラムに置き換えてクリップ間で共有する
+
+        Parameters
+        ----------
+        motion_df : pandas.DataFrame
+            モーションデータ
+
+        Returns
+        -------
+        pandas.DataFrame
+            モーションデータ
+        """
+
+        if self.shared_skeleton is not None and motion_df.columns.equals(
+            self.shared_skeleton.columns
+        ):
+            motion_df.columns = self.shared_skeleton.columns
+
         return motion_df
 
     def __get_joint_columns(self, joint: str):
@@ -250,7 +470,8 @@ class BVHparser:
             モーションデータ
         """
 
-        columns = self.motion_df.filter(like=joint).columns
+        # filter(like=joint) と同じ結果を, データフレームを作らずに取得する
+        columns = pd.Index([c for c in self.motion_df.columns if joint in c])
         return columns
 
     def __get_skeleton_str(self, joint: str):
@@ -322,19 +543,40 @@ class BVHparser:
 
         return joint_motion_df
 
-    def __get_absolute_motion_df(self, joint: str):
+    def __get_absolute_motion_df(
+        self,
+        joint: str,
+        n_jobs: int = 1,
+        chunk_size: int | None = None,
+        executor: str | Executor = "thread",
+    ):
         """
         絶対的な関節のモーションデータを取得する
 
+        Parameters
+        ----------
+        n_jobs : int
+            並列処理のワーカー数. 1の場合は単一スレッドで処理する
+        chunk_size : int
+            1チャンクあたりのフレーム数
+        executor : str or concurrent.futures.Executor
+            並列処理の方式 (thread, process または既存のプール)
+
         Returns
         -------
         pandas.DataFrame
             モーションデータ
         """
 
-        motion_df = self.get_motion_df()
         path = self.get_skeleton_path2root(joint)
 
+        if n_jobs != 1:
+            return self.__get_absolute_motion_df_chunked(
+                path, n_jobs, chunk_size, executor
+            )
+
+        motion_df = self.get_motion_df()
+
         joint_columns = self.__get_joint_columns(joint)
         joint_motion_df = motion_df[joint_columns]
         joint_motion_df.columns = [
@@ -354,6 +596,98 @@ class BVHparser:
 
         return joint_motion_df
 
+    def __get_absolute_motion_df_chunked(
+        self,
+        path: list[str],
+        n_jobs: int,
+        chunk_size: int | None,
+        executor: str | Executor,
+    ):
+        """
+        絶対的な関節のモーションデータをフレーム軸で分割して並列に計算する.
+        モーションデータを1つの配列に変換し, 各jointのカラムはその配列のビューとして渡す
+        (jointのカラムが連続していない場合のみコピーする)
+
+        Parameters
+        ----------
+        path : list
+            jointからrootまでのパス
+        n_jobs : int
+            並列処理のワーカー数
+        chunk_size : int
+            1チャンクあたりのフレーム数
+        executor : str or concurrent.futures.Executor
+            並列処理の方式
+
+        Returns
+        -------
+        pandas.DataFrame
+            モーションデータ
+        """
+
+        all_columns = self.motion_df.columns
+        values = self.motion_df.to_numpy(dtype=float)
+
+        path_positions = []
+        for path_joint in path:
+            path_columns = self.__get_joint_columns(path_joint)
+            positions = all_columns.get_indexer(path_columns)
+            names = [c.replace(f"{path_joint}_", "") for c in path_columns]
+            path_positions.append(dict(zip(names, positions)))
+
+        # 単一スレッドの場合と同じカラム構成になるよう揃える
+        columns = pd.Index(list(path_positions[0].keys()))
+        for positions in path_positions[1:]:
+            other = pd.Index(list(positions.keys()))
+            if not columns.equals(other):
+                columns = columns.union(other)
+
+        arrays = [
+            self.__get_column_view(values, [p.get(c, -1) for c in columns])
+            for p in path_positions
+        ]
+        motion = sum_path_chunked(arrays, n_jobs, chunk_size, executor)
+
+        joint_motion_df = pd.DataFrame(
+            motion, index=self.motion_df.index, columns=columns, copy=False
+        )
+        joint_motion_df.insert(0, "time", values[:, all_columns.get_loc("time")])
+
+        return joint_motion_df
+
+    def __get_column_view(self, values: np.ndarray, positions: list[int]):
+        """
+        配列から指定した位置のカラムを取り出す.
+        位置が連続していればビューを返し, そうでなければコピーする (-1 のカラムは NaN)
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            (フレーム数, カラム数) の配列
+        positions : list
+            取り出すカラムの位置
+
+        Returns
+        -------
+        numpy.ndarray
+            (フレーム数, len(positions)) の配列
+        """
+
+        n = len(positions)
+        if n == 0:
+            return values[:, :0]
+
+        start = positions[0]
+        if start >= 0 and list(positions) == list(range(start, start + n)):
+            return values[:, start : start + n]
+
+        array = np.full((values.shape[0], n), np.nan)
+        for i, position in enumerate(positions):
+            if position >= 0:
+                array[:, i] = values[:, position]
+
+        return array
+
     def __set_relative_joint_motion_df(self, joint: str, motion_df: pd.DataFrame):
         """
         jointの相対的なモーションデータを設定する
@@ -416,10 +750,19 @@ class BVHparser:
         Returns
         -------
         list
-            offset
+            offset (コピー)
+        """
+
+        return list(self.skeleton[joint]["offset"])
+
+    def __detach_skeleton(self):
+        """
+        共有している骨格データをこのクリップ用にコピーする (copy-on-write)
         """
 
-        return self.skeleton[joint]["offset"]
+        if self.shared_skeleton is not None:
+            self.skeleton = self.shared_skeleton.copy_joints()
+            self.shared_skeleton = None
 
     def set_joint_offset(self, joint: str, offset: list[int]):
         """
@@ -436,7 +779,10 @@ class BVHparser:
         if len(offset) != len(self.skeleton[joint]["offset"]):
             raise ValueError(f"offset length must be 3. but got {len(offset)}")
 
-        self.skeleton[joint]["offset"] = offset
+        # 共有している骨格は変更せず, このクリップ用にコピーしてから変更する
+        self.__detach_skeleton()
+
+        self.skeleton[joint]["offset"] = list(offset)
 
     def get_initial_position(
         self, index=100, channel_names=["Xposition", "Yposition", "Zposition"]
@@ -517,10 +863,10 @@ class BVHparser:
         Returns
         -------
         dict
-            骨格データ
+            骨格データ (コピー)
         """
 
-        return self.skeleton.copy()
+        return copy_joints(self.skeleton)
 
     def get_skeleton_path2root(self, joint: str):
         """
@@ -572,9 +918,16 @@ class BVHparser:
         if len(missing_columns) > 0:
             raise ValueError(f"columns {missing_columns} are missing in motion_df")
         else:
-            self.motion_df = motion_df.copy()
-
-    def get_joint_motion_df(self, joint: str, mode="relative"):
+            self.motion_df = self.__share_columns(motion_df.copy())
+
+    def get_joint_motion_df(
+        self,
+        joint: str,
+        mode="relative",
+        n_jobs: int = 1,
+        chunk_size: int | None = None,
+        executor: str | Executor = "thread",
+    ):
         """
         指定したjointのモーションデータを取得する
 
@@ -586,6 +939,16 @@ class BVHparser:
             モーションデータの種類
             relative: 相対的な関節のモーションデータ
             absolute: 絶対的な関節のモーションデータ
+        n_jobs : int
+            absolute の計算に使うワーカー数. -1の場合はCPUコア数
+        chunk_size : int
+            absolute の計算でフレーム軸を分割する際の1チャンクあたりのフレーム数
+        executor : str or concurrent.futures.Executor
+            absolute の計算の並列処理の方式
+            thread: スレッドプール
+            process: 共有メモリを介したプロセスプール.
+                呼び出しごとにプロセスを起動するため, 非常に長いクリップでのみ有効
+            Executor: 渡されたスレッドプールまたはプロセスプールを使う
 
         Returns
         -------
@@ -596,7 +959,7 @@ class BVHparser:
         if mode == "relative":
             return self.__get_relative_motion_df(joint)
         elif mode == "absolute":
-            return self.__get_absolute_motion_df(joint)
+            return self.__get_absolute_motion_df(joint, n_jobs, chunk_size, executor)
         else:
             raise ValueError(f"invalid mode: {mode}")
 
@@ -645,7 +1008,7 @@ class BVHparser:
             チャンネル名のリスト
         """
 
-        return self.channels
+        return list(self.channels)
 
     def to_csv(self, filename: str, index=False):
         """
@@ -679,6 +1042,10 @@ class BVHparser:
         columns = self.__get_columns(self.root)
         motion_df = self.get_motion_df()
 
+        missing_columns = set(columns) - set(motion_df.columns)
+        if len(missing_columns) > 0:
+            raise ValueError(f"columns {missing_columns} are missing in motion_df")
+
         reordered_motion_df = motion_df[columns]
         motion = reordered_motion_df.to_csv(index=False, header=False, sep=" ")
 
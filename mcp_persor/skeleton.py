@@ -0,0 +1,281 @@
+from threading import Lock
+from typing import Iterator, Mapping, Sequence
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from mcp_persor.type import JointData
+
+
+class FrozenDict(Mapping):
+    """
+    読み取り専用の dict (pickle 可能)
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: Mapping):
+        self._data = dict(data)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self) -> Iterator:
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"FrozenDict({self._data!r})"
+
+    def __reduce__(self):
+        return (FrozenDict, (self._data,))
+
+
+class SharedSkeleton:
+    """
+    複数のクリップで共有する骨格データ
+
+    同じ構造の骨格を持つ BVHparser はこのオブジェクトを共有する.
+    骨格データは変更できないよう, 各jointのデータは FrozenDict,
+    offset, children, channels およびチャンネル名の一覧は tuple で保持する
+    """
+
+    __slots__ = ("joints", "root", "channels", "columns", "_offsets", "__weakref__")
+
+    def __init__(self, joints: Mapping[str, JointData], root: str):
+        self.joints: Mapping[str, JointData] = FrozenDict(
+            {j: freeze_joint(data) for j, data in joints.items()}
+        )
+        self.root = root
+        self.channels = tuple(get_channels(joints))
+        self.columns = pd.Index(["time", *self.channels])
+        self._offsets = get_offsets(joints)
+
+    def __reduce__(self):
+        # 復元時に登録済みの骨格を探し, プロセスをまたいでも共有されるようにする
+        return (intern_skeleton, (copy_joints(self.joints), self.root, 0.0))
+
+    def copy_joints(self):
+        """
+        骨格データを変更可能な dict としてコピーする
+
+        Returns
+        -------
+        dict
+            骨格データ
+        """
+
+        return copy_joints(self.joints)
+
+
+# 使われなくなった骨格データは解放されるよう弱参照で保持する
+_registry: dict[tuple, list[weakref.ref[SharedSkeleton]]] = {}
+_registry_lock = Lock()
+
+
+def freeze_joint(data: JointData):
+    """
+    jointのデータを読み取り専用にする
+
+    Parameters
+    ----------
+    data : JointData
+        jointのデータ
+
+    Returns
+    -------
+    FrozenDict
+        読み取り専用のjointのデータ
+    """
+
+    return FrozenDict(
+        {
+            "joint": data["joint"],
+            "children": tuple(data["children"]),
+            "offset": tuple(data["offset"]),
+            "channels": tuple(data["channels"]),
+        }
+    )
+
+
+def copy_joints(joints: Mapping[str, JointData]):
+    """
+    骨格データを変更可能な dict としてコピーする
+
+    Parameters
+    ----------
+    joints : dict
+        骨格データ
+
+    Returns
+    -------
+    dict
+        骨格データ
+    """
+
+    return {
+        j: {
+            "joint": data["joint"],
+            "children": list(data["children"]),
+            "offset": list(data["offset"]),
+            "channels": list(data["channels"]),
+        }
+        for j, data in joints.items()
+    }
+
+
+def get_channels(joints: Mapping[str, JointData]):
+    """
+    チャンネル名のリストを取得する
+
+    Parameters
+    ----------
+    joints : dict
+        骨格データ
+
+    Returns
+    -------
+    list
+        チャンネル名のリスト
+    """
+
+    channels = []
+    for j in joints.keys():
+        channels += [f"{j}_{c}" for c in joints[j]["channels"]]
+
+    return channels
+
+
+def get_structure_key(joints: Mapping[str, JointData]):
+    """
+    offset 以外の骨格の構造を表すキーを取得する
+
+    Parameters
+    ----------
+    joints : dict
+        骨格データ
+
+    Returns
+    -------
+    tuple
+        関節名, 親関節, チャンネル, offset の次元数の組
+    """
+
+    return tuple(
+        (j, data["joint"], tuple(data["channels"]), len(data["offset"]))
+        for j, data in joints.items()
+    )
+
+
+def get_offsets(joints: Mapping[str, JointData]):
+    """
+    全関節の offset を1次元配列として取得する
+
+    Parameters
+    ----------
+    joints : dict
+        骨格データ
+
+    Returns
+    -------
+    numpy.ndarray
+        offset
+    """
+
+    return np.array(
+        [o for data in joints.values() for o in data["offset"]], dtype=float
+    )
+
+
+def intern_skeleton(
+    joints: dict[str, JointData], root: str, tolerance: float = 1e-6
+):
+    """
+    同じ構造の骨格が登録済みであればそれを返し, なければ登録する
+
+    Parameters
+    ----------
+    joints : dict
+        骨格データ
+    root : str
+        root の関節名
+    tolerance : float
+        offset を同一とみなす許容誤差
+
+    Returns
+    -------
+    SharedSkeleton
+        共有される骨格データ
+    """
+
+    key = (root, get_structure_key(joints))
+    offsets = get_offsets(joints)
+
+    with _registry_lock:
+        candidates = _registry.setdefault(key, [])
+        alive = []
+        found = None
+        for ref in candidates:
+            skeleton = ref()
+            if skeleton is None:
+                continue
+            alive.append(ref)
+            if found is None and np.allclose(
+                skeleton._offsets, offsets, rtol=0, atol=tolerance
+            ):
+                found = skeleton
+
+        if found is None:
+            found = SharedSkeleton(joints, root)
+            alive.append(weakref.ref(found))
+        _registry[key] = alive
+
+        return found
+
+
+def clear_skeleton_cache():
+    """
+    登録済みの骨格データを全て削除する
+    """
+
+    with _registry_lock:
+        _registry.clear()
+
+
+def stack_motions(parsers: Sequence, fill_value: float = np.nan):
+    """
+    同じ骨格を持つクリップのモーションデータを1つの配列にまとめる
+
+    Parameters
+    ----------
+    parsers : list
+        BVHparser のリスト
+    fill_value : float
+        フレーム数が足りないクリップを埋める値
+
+    Returns
+    -------
+    numpy.ndarray
+        (クリップ数, 最大フレーム数, カラム数) のモーションデータ.
+        カラムの並びは get_motion_df() と同じ
+    """
+
+    if len(parsers) == 0:
+        raise ValueError("parsers is empty")
+
+    columns = parsers[0].motion_df.columns
+    for parser in parsers[1:]:
+        other = parser.motion_df.columns
+        if other is not columns and not columns.equals(other):
+            raise ValueError("all clips must have the same skeleton")
+
+    n = max(parser.motion_df.shape[0] for parser in parsers)
+    motions = np.full((len(parsers), n, len(columns)), fill_value, dtype=float)
+    for i, parser in enumerate(parsers):
+        motion = parser.motion_df.to_numpy(dtype=float)
+        motions[i, : motion.shape[0]] = motion
+
+    return motions
@@ -22,4 +22,7 @@ setup(
     python_requires=">=3.7",
     install_requires=INSTALL_REQUIRES,
     include_package_data=True,
+    entry_points={
+        "console_scripts": ["mcp-persor=mcp_persor.cli:main"],
+    },
 )
@@ -0,0 +1,112 @@
+from pathlib import Path
+import json
+import shutil
+
+import pytest
+
+from mcp_persor import cli
+
+BVH_DIR = Path(__file__).parent.parent / "bvh"
+
+
+@pytest.fixture
+def input_dir(tmp_path):
+    input_dir = tmp_path / "in"
+    (input_dir / "sub").mkdir(parents=True)
+    shutil.copy(BVH_DIR / "jump.bvh", input_dir / "jump.bvh")
+    shutil.copy(BVH_DIR / "chair.bvh", input_dir / "sub" / "chair.bvh")
+    return input_dir
+
+
+def run(*argv):
+    return cli.run(cli.get_parser().parse_args([*argv, "-j", "1", "-q"]))
+
+
+def test_convert_skips_up_to_date(input_dir, tmp_path):
+    output_dir = tmp_path / "out"
+
+    assert run("convert", str(input_dir), str(output_dir))["converted"] == 2
+    assert (output_dir / "jump.csv").exists()
+    assert (output_dir / "sub" / "chair.csv").exists()
+
+    summary = run("convert", str(input_dir), str(output_dir))
+    assert summary["converted"] == 0
+    assert summary["skipped"] == 2
+
+
+def test_normalize_reconverts_when_options_change(input_dir, tmp_path):
+    output_dir = tmp_path / "out"
+
+    run("normalize", str(input_dir), str(output_dir), "--position", "0", "90", "0")
+    summary = run(
+        "normalize", str(input_dir), str(output_dir), "--position", "0", "90", "0"
+    )
+    assert summary["skipped"] == 2
+
+    summary = run(
+        "normalize", str(input_dir), str(output_dir), "--position", "1", "1", "1"
+    )
+    assert summary["converted"] == 2
+
+
+def test_output_inside_input_is_excluded(input_dir):
+    output_dir = input_dir / "norm"
+
+    run("normalize", str(input_dir), str(output_dir))
+    summary = run("normalize", str(input_dir), str(output_dir), "--force")
+
+    assert summary["converted"] == 2
+    assert not (output_dir / "norm").exists()
+
+
+def test_normalize_rejects_same_input_and_output(input_dir):
+    with pytest.raises(ValueError):
+        run("normalize", str(input_dir), str(input_dir))
+
+
+def test_interrupted_run_keeps_completed_records(input_dir, tmp_path, monkeypatch):
+    output_dir = tmp_path / "out"
+    as_completed = cli.as_completed
+
+    def interrupted(futures):
+        for i, future in enumerate(as_completed(futures)):
+            if i == 1:
+                raise KeyboardInterrupt
+            yield future
+
+    monkeypatch.setattr(cli, "as_completed", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        run("convert", str(input_dir), str(output_dir))
+    monkeypatch.undo()
+
+    assert len(cli.read_manifest(output_dir)) == 1
+    assert not (output_dir / f"{cli.MANIFEST_NAME}.tmp").exists()
+
+    summary = run("convert", str(input_dir), str(output_dir))
+    assert summary["skipped"] == 1
+    assert summary["converted"] == 1
+
+
+def test_unwritable_report(input_dir, tmp_path, capsys):
+    output_dir = tmp_path / "out"
+    report = tmp_path / "missing" / "report.json"
+
+    code = cli.main(
+        ["convert", str(input_dir), str(output_dir), "--report", str(report)]
+    )
+
+    assert code == 2
+    assert "mcp-persor:" in capsys.readouterr().err
+    assert not output_dir.exists()
+
+
+def test_report(input_dir, tmp_path):
+    output_dir = tmp_path / "out"
+    report = tmp_path / "report.json"
+
+    code = cli.main(
+        ["convert", str(input_dir), str(output_dir), "-q", "--report", str(report)]
+    )
+
+    assert code == 0
+    assert json.loads(report.read_text())["converted"] == 2
@@ -0,0 +1,45 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from mcp_persor import BVHparser
+
+BVH_DIR = Path(__file__).parent.parent / "bvh"
+
+
+@pytest.fixture(scope="module")
+def bvhp():
+    return BVHparser(str(BVH_DIR / "jump.bvh"))
+
+
+@pytest.mark.parametrize("joint", ["root", "l_hand", "r_toes"])
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"n_jobs": 4},
+        {"n_jobs": -1, "chunk_size": 37},
+        {"n_jobs": 2, "executor": "process"},
+    ],
+)
+def test_absolute_parallel_matches_serial(bvhp, joint, kwargs):
+    expected = bvhp.get_joint_motion_df(joint, mode="absolute")
+    actual = bvhp.get_joint_motion_df(joint, mode="absolute", **kwargs)
+    pd.testing.assert_frame_equal(expected, actual, check_exact=True)
+
+
+@pytest.mark.parametrize("pool_class", [ThreadPoolExecutor, ProcessPoolExecutor])
+def test_absolute_parallel_with_pool(bvhp, pool_class):
+    expected = bvhp.get_joint_motion_df("l_hand", mode="absolute")
+    with pool_class(max_workers=2) as pool:
+        for _ in range(2):
+            actual = bvhp.get_joint_motion_df(
+                "l_hand", mode="absolute", n_jobs=2, executor=pool
+            )
+            pd.testing.assert_frame_equal(expected, actual, check_exact=True)
+
+
+def test_invalid_executor(bvhp):
+    with pytest.raises(ValueError):
+        bvhp.get_joint_motion_df("l_hand", mode="absolute", n_jobs=2, executor="gpu")
@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from mcp_persor import BVHparser
+
+BVH_DIR = Path(__file__).parent.parent / "bvh"
+JUMP = str(BVH_DIR / "jump.bvh")
+
+
+@pytest.fixture(scope="module")
+def full():
+    return BVHparser(JUMP)
+
+
+def test_frames_matches_sliced_full_load(full):
+    bvhp = BVHparser(JUMP, frames=slice(100, 200, 3))
+
+    expected = full.get_motion_df().iloc[100:200:3].reset_index(drop=True)
+    pd.testing.assert_frame_equal(expected, bvhp.get_motion_df())
+    assert bvhp.bvh is None
+
+
+def test_negative_frames(full):
+    bvhp = BVHparser(JUMP, frames=slice(-5, None))
+
+    expected = full.get_motion_df().iloc[-5:].reset_index(drop=True)
+    pd.testing.assert_frame_equal(expected, bvhp.get_motion_df())
+
+
+def test_time_range_matches_sliced_full_load(full):
+    bvhp = BVHparser(JUMP, time_range=(1.0, 2.0))
+
+    motion_df = full.get_motion_df()
+    mask = (motion_df["time"] >= 1.0 - 1e-9) & (motion_df["time"] < 2.0 - 1e-9)
+    expected = motion_df[mask].reset_index(drop=True)
+    pd.testing.assert_frame_equal(expected, bvhp.get_motion_df())
+
+
+@pytest.mark.parametrize("joint", ["l_hand", "head"])
+def test_joints_absolute_matches_full_load(full, joint):
+    bvhp = BVHparser(JUMP, joints=["l_hand", "head"], frames=slice(100, 200))
+
+    expected = (
+        full.get_joint_motion_df(joint, mode="absolute")
+        .iloc[100:200]
+        .reset_index(drop=True)
+    )
+    pd.testing.assert_frame_equal(
+        expected, bvhp.get_joint_motion_df(joint, mode="absolute")
+    )
+    assert "r_hand_Xrotation" not in bvhp.get_channels()
+
+
+def test_end_site_resolves_to_parent():
+    bvhp = BVHparser(JUMP, joints=["_End_head"])
+
+    assert bvhp.get_channels() == BVHparser(JUMP, joints=["head"]).get_channels()
+
+
+def test_invalid_selection():
+    with pytest.raises(ValueError):
+        BVHparser(JUMP, joints=["tail"])
+    with pytest.raises(ValueError):
+        BVHparser(JUMP, frames=slice(0, 10), time_range=(0, 1))
+
+
+def test_to_bvh_requires_all_joints(tmp_path):
+    bvhp = BVHparser(JUMP, joints=["head"])
+
+    with pytest.raises(ValueError):
+        bvhp.to_bvh(str(tmp_path / "out.bvh"))
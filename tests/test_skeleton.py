@@ -0,0 +1,171 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import copy
+import gc
+import pickle
+
+import numpy as np
+import pytest
+
+from mcp_persor import BVHparser, clear_skeleton_cache, stack_motions
+from mcp_persor import skeleton
+
+BVH_DIR = Path(__file__).parent.parent / "bvh"
+JUMP = str(BVH_DIR / "jump.bvh")
+CHAIR = str(BVH_DIR / "chair.bvh")
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    clear_skeleton_cache()
+    yield
+    clear_skeleton_cache()
+
+
+def test_shared_skeleton():
+    a = BVHparser(JUMP)
+    b = BVHparser(JUMP)
+
+    assert a.shared_skeleton is b.shared_skeleton
+    assert a.skeleton is b.skeleton
+    assert a.channels is b.channels
+    assert a.motion_df.columns is a.shared_skeleton.columns
+    assert b.motion_df.columns is a.shared_skeleton.columns
+    assert a.default_motion_df.columns is a.shared_skeleton.columns
+
+
+def test_unshared_skeleton_is_equivalent():
+    a = BVHparser(JUMP)
+    b = BVHparser(JUMP, share_skeleton=False)
+
+    assert b.shared_skeleton is None
+    assert a.get_channels() == b.get_channels()
+    assert a.get_skeleton() == b.get_skeleton()
+    assert a.motion_df.equals(b.motion_df)
+
+
+def test_getters_return_copies():
+    a = BVHparser(JUMP)
+    b = BVHparser(JUMP)
+    root_offset = b.get_joint_offset("root")
+    torso_offset = b.get_joint_offset("torso_1")
+
+    a.get_skeleton()["root"]["offset"][1] = 999
+    a.get_joint_offset("torso_1")[0] = 5
+
+    assert a.get_joint_offset("root") == root_offset
+    assert b.get_joint_offset("root") == root_offset
+    assert b.get_joint_offset("torso_1") == torso_offset
+    assert BVHparser(JUMP).get_joint_offset("root") == root_offset
+
+
+def test_get_channels_returns_copy():
+    a = BVHparser(JUMP)
+    b = BVHparser(JUMP)
+    channels = b.get_channels()
+
+    a.get_channels().append("x")
+
+    assert b.get_channels() == channels
+    assert a.get_channels() == channels
+    assert BVHparser(JUMP).get_channels() == channels
+
+
+def test_shared_skeleton_is_immutable():
+    a = BVHparser(JUMP)
+
+    with pytest.raises(TypeError):
+        a.skeleton["root"]["offset"] = [0, 0, 0]
+    with pytest.raises(TypeError):
+        a.skeleton["root"]["offset"][0] = 0
+    with pytest.raises(TypeError):
+        a.skeleton["root"] = {}
+
+
+def test_set_joint_offset_copy_on_write():
+    a = BVHparser(JUMP)
+    b = BVHparser(JUMP)
+    head_offset = a.get_joint_offset("head")
+
+    b.set_joint_offset("head", [1, 2, 3])
+
+    assert b.get_joint_offset("head") == [1, 2, 3]
+    assert b.shared_skeleton is None
+    assert a.get_joint_offset("head") == head_offset
+    assert BVHparser(JUMP).get_joint_offset("head") == head_offset
+
+
+def test_registry_releases_unused_skeletons():
+    a = BVHparser(JUMP)
+    ref = skeleton._registry[next(iter(skeleton._registry))][0]
+    assert ref() is a.shared_skeleton
+
+    del a
+    gc.collect()
+
+    assert ref() is None
+
+
+def test_stack_motions():
+    a = BVHparser(JUMP)
+    b = BVHparser(CHAIR)
+
+    motions = stack_motions([a, b])
+
+    n = max(a.motion_df.shape[0], b.motion_df.shape[0])
+    assert motions.shape == (2, n, a.motion_df.shape[1])
+    np.testing.assert_array_equal(motions[0, : a.motion_df.shape[0]], a.motion_df)
+    assert np.isnan(motions[0, a.motion_df.shape[0] :]).all()
+
+
+def test_stack_motions_different_skeleton():
+    a = BVHparser(JUMP)
+    b = BVHparser(JUMP, joints=["head"])
+
+    with pytest.raises(ValueError):
+        stack_motions([a, b])
+
+
+def load(filename):
+    return BVHparser(filename)
+
+
+def test_pickle_keeps_sharing():
+    a = BVHparser(JUMP)
+
+    b = pickle.loads(pickle.dumps(a))
+
+    assert b.shared_skeleton is a.shared_skeleton
+    assert b.skeleton is a.skeleton
+    assert b.motion_df.columns is a.shared_skeleton.columns
+    assert b.get_skeleton() == a.get_skeleton()
+    assert b.motion_df.equals(a.motion_df)
+
+
+def test_pickle_after_copy_on_write():
+    a = BVHparser(JUMP)
+    a.set_joint_offset("head", [1, 2, 3])
+
+    b = pickle.loads(pickle.dumps(a))
+
+    assert b.shared_skeleton is None
+    assert b.get_joint_offset("head") == [1, 2, 3]
+
+
+def test_deepcopy():
+    a = BVHparser(JUMP)
+
+    b = copy.deepcopy(a)
+    b.set_joint_offset("head", [1, 2, 3])
+
+    assert b.motion_df.equals(a.motion_df)
+    assert b.motion_df is not a.motion_df
+    assert a.get_joint_offset("head") != [1, 2, 3]
+
+
+def test_parsers_from_process_pool():
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        (a, b) = pool.map(load, [JUMP, JUMP])
+
+    assert a.shared_skeleton is b.shared_skeleton
+    assert BVHparser(JUMP).shared_skeleton is a.shared_skeleton